@@ -29,22 +29,37 @@
 # Classes for reading/writing AXI4-Lite interfaces.
 
 import cocotb
-from cocotb.triggers import RisingEdge
+from cocotb.triggers import RisingEdge, Lock, Event
 from cocotb.result import ReturnValue
+from collections import deque
 
 
 class AXI_Lite_Writer(object):
     """AXI4-Lite interface writer."""
 
-    def connect(self, dut, clk, bit_width, prefix=None):
+    def connect(self, dut, clk, bit_width, prefix=None, max_outstanding=1):
         """Connect the DuT AXI4-Lite interface to this writer.
 
         When parameter 'prefix' is not set, DuT AXI4-Lite signals are expected
         to be named s_axi_awaddr, s_axi_awvalid, ... If 'prefix' is set, DuT
         AXI4-Lite signals are expected to be named s_axi_<prefix>_awaddr, ...
+        Parameter 'max_outstanding' limits the number of writes that may wait
+        for their write response at the same time.
         """
         self.bit_width = bit_width
-        self.access_active = False
+        self.max_outstanding = max_outstanding
+        self.busy = Lock()
+
+        # completion events of writes waiting for their response (in order)
+        self._pending = deque()
+        self._pending_event = Event()
+
+        # response collector task, started by the first pipelined write. Stop
+        # the one of a previous connection so it does not consume responses
+        collector = getattr(self, "_collector", None)
+        if collector is not None and not collector._finished:
+            collector.kill()
+        self._collector = None
 
         if prefix is None:
             sig_prefix = "s_axi"
@@ -52,15 +67,17 @@ class AXI_Lite_Writer(object):
             sig_prefix = "s_axi_%s" % prefix
 
         self.clk = clk
-        self.awaddr = getattr(dut, "%s_awaddr" % sig_prefix)
-        self.awvalid = getattr(dut, "%s_awvalid" % sig_prefix)
-        self.awready = getattr(dut, "%s_awready" % sig_prefix)
-        self.wdata = getattr(dut, "%s_wdata" % sig_prefix)
-        self.wstrb = getattr(dut, "%s_wstrb" % sig_prefix)
-        self.wvalid = getattr(dut, "%s_wvalid" % sig_prefix)
-        self.wready = getattr(dut, "%s_wready" % sig_prefix)
-        self.bvalid = getattr(dut, "%s_bvalid" % sig_prefix)
-        self.bready = getattr(dut, "%s_bready" % sig_prefix)
+        for sig in ("awaddr", "awvalid", "awready", "wdata", "wstrb", "wvalid",
+                    "wready", "bvalid", "bready"):
+            setattr(self, sig, getattr(dut, "%s_%s" % (sig_prefix, sig)))
+
+        # bind the (scheduled) assignment methods of the signals driven
+        # during a write, equivalent to 'sig <= value'
+        self._set_awaddr = self.awaddr.__le__
+        self._set_awvalid = self.awvalid.__le__
+        self._set_wdata = self.wdata.__le__
+        self._set_wvalid = self.wvalid.__le__
+        self._set_bready = self.bready.__le__
 
     @cocotb.coroutine
     def rst(self):
@@ -68,51 +85,96 @@ class AXI_Lite_Writer(object):
         self.awvalid <= 0
         self.wvalid <= 0
         self.bready <= 0
-        self.wstrb <= 2**(self.bit_width/8)-1
+        self.wstrb <= (1 << (self.bit_width // 8)) - 1
         yield RisingEdge(self.clk)
 
     @cocotb.coroutine
     def write(self, addr, data):
         """Write data to the AXI4-Lite interface."""
-        # serialize access
-        while True:
-            if not self.access_active:
-                break
-            yield RisingEdge(self.clk)
-        self.access_active = True
-
-        self.awaddr <= addr
-        self.awvalid <= 1
+        done = yield self.write_pipelined(addr, data)
+        yield done.wait()
 
-        self.wdata <= data
-        self.wvalid <= 1
+    @cocotb.coroutine
+    def write_pipelined(self, addr, data):
+        """Write data to the AXI4-Lite interface without awaiting response.
 
-        self.bready <= 1
+        Performs the address and data phase of the write and returns an Event
+        that is set once the write response has been received. Consecutive
+        writes may be issued before earlier ones complete, up to the
+        'max_outstanding' limit set in connect().
+        """
+        edge = RisingEdge(self.clk)
+        done = Event()
+
+        # write responses are received independently of address/data phases.
+        # The collector is killed by the scheduler at the end of each test,
+        # start a new one (and drop writes it left unanswered) if required
+        if self._collector is None or self._collector._finished:
+            self._pending = deque()
+            self._pending_event = Event()
+            self._collector = cocotb.fork(self._collect_responses())
+
+        # serialize address and data phases
+        yield self.busy.acquire()
+
+        try:
+            # wait for the oldest write to complete if the limit is reached
+            while len(self._pending) >= self.max_outstanding:
+                yield self._pending[0].wait()
+
+            # drive address and data channels together. Writes are queued by
+            # the scheduler until the next yield, so they are all applied to
+            # the simulator in the same write phase
+            self._set_awaddr(addr)
+            self._set_awvalid(1)
+            self._set_wdata(data)
+            self._set_wvalid(1)
+
+            # address and data handshakes complete independently. Deassert
+            # each VALID in the cycle its handshake completes
+            aw_done = False
+            w_done = False
+            while not (aw_done and w_done):
+                yield edge
+                if not aw_done and self.awready.value.integer == 1:
+                    aw_done = True
+                    self._set_awvalid(0)
+                if not w_done and self.wready.value.integer == 1:
+                    w_done = True
+                    self._set_wvalid(0)
+
+            # hand the write over to the response collector
+            self._pending.append(done)
+            self._pending_event.set()
+        finally:
+            # release access lock
+            self.busy.release()
+
+        raise ReturnValue(done)
 
-        while True:
-            yield RisingEdge(self.clk)
-            if int(self.awready) == 1:
-                break
+    @cocotb.coroutine
+    def _collect_responses(self):
+        """Receive write responses and signal completion of pending writes."""
+        edge = RisingEdge(self.clk)
 
         while True:
-            if int(self.wready) == 1:
-                break
-            yield RisingEdge(self.clk)
+            if not self._pending:
+                # wait for next write to complete its address and data phase
+                self._pending_event.clear()
+                yield self._pending_event.wait()
 
-        self.awvalid <= 0
-        self.wvalid <= 0
+            self._set_bready(1)
 
-        while True:
-            yield RisingEdge(self.clk)
-            if int(self.bvalid) == 1:
-                break
+            while True:
+                yield edge
+                if self.bvalid.value.integer == 1:
+                    break
 
-        self.bready <= 0
-
-        yield RisingEdge(self.clk)
-
-        # release access lock
-        self.access_active = False
+            # responses arrive in the order the writes were issued
+            done = self._pending.popleft()
+            if not self._pending:
+                self._set_bready(0)
+            done.set()
 
 
 class AXI_Lite_Reader(object):
@@ -126,7 +188,7 @@ class AXI_Lite_Reader(object):
         AXI4-Lite signals are expected to be named s_axi_<prefix>_araddr, ...
         """
         self.bit_width = bit_width
-        self.access_active = False
+        self.busy = Lock()
 
         if prefix is None:
             sig_prefix = "s_axi"
@@ -134,12 +196,9 @@ class AXI_Lite_Reader(object):
             sig_prefix = "s_axi_%s" % prefix
 
         self.clk = clk
-        self.araddr = getattr(dut, "%s_araddr" % sig_prefix)
-        self.arvalid = getattr(dut, "%s_arvalid" % sig_prefix)
-        self.arready = getattr(dut, "%s_arready" % sig_prefix)
-        self.rdata = getattr(dut, "%s_rdata" % sig_prefix)
-        self.rvalid = getattr(dut, "%s_rvalid" % sig_prefix)
-        self.rready = getattr(dut, "%s_rready" % sig_prefix)
+        for sig in ("araddr", "arvalid", "arready", "rdata", "rvalid",
+                    "rready"):
+            setattr(self, sig, getattr(dut, "%s_%s" % (sig_prefix, sig)))
 
     @cocotb.coroutine
     def rst(self):
@@ -151,37 +210,61 @@ class AXI_Lite_Reader(object):
     @cocotb.coroutine
     def read(self, addr):
         """Read data from the AXI4-Lite interface."""
+        edge = RisingEdge(self.clk)
+
         # serialize access
-        while True:
-            if not self.access_active:
-                break
-            yield RisingEdge(self.clk)
-        self.access_active = True
+        yield self.busy.acquire()
 
-        self.araddr <= addr
-        self.arvalid <= 1
+        try:
+            # drive address and response channels together (applied in the
+            # same write phase)
+            self.araddr <= addr
+            self.arvalid <= 1
+            self.rready <= 1
 
-        self.rready <= 1
+            while True:
+                yield edge
+                if self.arready.value.integer == 1:
+                    break
 
-        while True:
-            yield RisingEdge(self.clk)
-            if int(self.arready) == 1:
-                break
+            self.arvalid <= 0
 
-        self.arvalid <= 0
+            while True:
+                yield edge
+                if self.rvalid.value.integer == 1:
+                    break
 
-        while True:
-            yield RisingEdge(self.clk)
-            if int(self.rvalid) == 1:
-                break
+            self.rready <= 0
 
-        self.rready <= 0
+            data = self.rdata.value.integer
+        finally:
+            # release access lock
+            self.busy.release()
 
-        data = int(self.rdata)
+        raise ReturnValue(data)
 
-        yield RisingEdge(self.clk)
 
-        # release access lock
-        self.access_active = False
+@cocotb.coroutine
+def parallel_rw(writer, reader, writes, reads):
+    """Perform AXI4-Lite writes and reads concurrently.
 
-        raise ReturnValue(data)
+    Read and write address/data channels of AXI4-Lite are independent, so
+    writes issued by 'writer' and reads issued by 'reader' may overlap.
+    Parameter 'writes' is a list of (addr, data) tuples, parameter 'reads' a
+    list of addresses. Accesses of the same type are still serialized by the
+    writer/reader. Returns the list of data values read (in the order of
+    'reads').
+    """
+    write_tasks = [cocotb.fork(writer.write(addr, data))
+                   for addr, data in writes]
+    read_tasks = [cocotb.fork(reader.read(addr)) for addr in reads]
+
+    for task in write_tasks:
+        yield task.join()
+
+    results = []
+    for task in read_tasks:
+        data = yield task.join()
+        results.append(data)
+
+    raise ReturnValue(results)
@@ -30,7 +30,6 @@
 
 import cocotb
 from cocotb.triggers import RisingEdge
-from cocotb.result import ReturnValue
 import random
 
 
@@ -46,21 +45,24 @@ class AXIS_Writer(object):
         """
         self.bit_width = bit_width
 
+        # TKEEP value of a full (non-last) data word
+        self._tkeep_full = (1 << (bit_width // 8)) - 1
+
         if prefix is None:
             sig_prefix = "s_axis"
         else:
             sig_prefix = "s_axis_%s" % prefix
 
         self.clk = clk
-        self.s_axis_tdata = getattr(dut, "%s_tdata" % sig_prefix)
-        self.s_axis_tvalid = getattr(dut, "%s_tvalid" % sig_prefix)
-        self.s_axis_tlast = getattr(dut, "%s_tlast" % sig_prefix)
-        self.s_axis_tkeep = getattr(dut, "%s_tkeep" % sig_prefix)
+        for sig in ("tdata", "tvalid", "tlast", "tkeep"):
+            setattr(self, "s_axis_%s" % sig,
+                    getattr(dut, "%s_%s" % (sig_prefix, sig)))
 
         # flow control (tready) is optional
         try:
             self.s_axis_tready = getattr(dut, "%s_tready" % sig_prefix)
             self.has_tready = True
+            self._tready_rising = RisingEdge(self.s_axis_tready)
         except AttributeError:
             self.has_tready = False
 
@@ -71,8 +73,16 @@ class AXIS_Writer(object):
         except AttributeError:
             self.has_tuser = False
 
-    @cocotb.coroutine
-    def rst(self):
+        # bind the (scheduled) assignment methods of the signals driven in
+        # the per-word loop, equivalent to 'sig <= value'
+        self._set_tdata = self.s_axis_tdata.__le__
+        self._set_tvalid = self.s_axis_tvalid.__le__
+        self._set_tlast = self.s_axis_tlast.__le__
+        self._set_tkeep = self.s_axis_tkeep.__le__
+        if self.has_tuser:
+            self._set_tuser = self.s_axis_tuser.__le__
+
+    async def rst(self):
         """Reset signals."""
         self.s_axis_tdata <= 0
         self.s_axis_tvalid <= 0
@@ -80,10 +90,9 @@ class AXIS_Writer(object):
         self.s_axis_tkeep <= 0
         if self.has_tuser:
             self.s_axis_tuser <= 0
-        yield RisingEdge(self.clk)
+        await RisingEdge(self.clk)
 
-    @cocotb.coroutine
-    def write(self, tdata, tkeep, tuser=None, insert_random_gaps=True):
+    async def write(self, tdata, tkeep, tuser=None, insert_random_gaps=True):
         """Perform write on AXI4-Stream slave interface.
 
         Writes a complete transfer on the AXI4-Stream slave interface. The
@@ -93,36 +102,77 @@ class AXIS_Writer(object):
         (which is the default), random idle gaps are inserted by setting
         TVALID low.
         """
+        edge = RisingEdge(self.clk)
+
+        if insert_random_gaps and len(tdata) > 1:
+            # draw one random byte per word up front instead of calling the
+            # PRNG for each word. A gap is inserted if the byte is below 51,
+            # i.e. with a chance of ~20%
+            gaps = random.getrandbits(8*len(tdata)).to_bytes(len(tdata),
+                                                             'little')
+        else:
+            gaps = None
+
+        # optional signals are fixed after connect(), resolve them once
+        has_tuser = self.has_tuser
+        if has_tuser:
+            # words without a TUSER value get TUSER set to zero. Pad the list
+            # once instead of checking its length for every word
+            if tuser is None:
+                tuser = [0] * len(tdata)
+            elif len(tuser) < len(tdata):
+                tuser = list(tuser) + [0] * (len(tdata) - len(tuser))
+        if self.has_tready:
+            s_axis_tready = self.s_axis_tready
+            tready_rising = self._tready_rising
+        else:
+            s_axis_tready = None
+
+        set_tdata = self._set_tdata
+        set_tvalid = self._set_tvalid
+        set_tuser = self._set_tuser if has_tuser else None
+        last = len(tdata) - 1
+
+        # TVALID and TKEEP only need to be driven when their values change:
+        # TVALID is only low during gaps and TKEEP is all ones for every word
+        # except the last one
+        set_tvalid(1)
+        if last > 0:
+            self._set_tkeep(self._tkeep_full)
+
         for i, word in enumerate(tdata):
-            self.s_axis_tdata <= word
-            self.s_axis_tvalid <= 1
-
-            if self.has_tuser:
-                if i < len(tuser):
-                    self.s_axis_tuser <= tuser[i]
-                else:
-                    self.s_axis_tuser <= 0
-
-            if i == len(tdata)-1:
-                self.s_axis_tlast <= 1
-                self.s_axis_tkeep <= tkeep
-            else:
-                self.s_axis_tkeep <= pow(2, self.bit_width/8)-1
+            set_tdata(word)
 
-            while True:
-                yield RisingEdge(self.clk)
-                if not self.has_tready or int(self.s_axis_tready) == 1:
-                    break
+            if has_tuser:
+                set_tuser(tuser[i])
 
-            if insert_random_gaps:
+            if i == last:
+                self._set_tlast(1)
+                self._set_tkeep(tkeep)
+
+            if s_axis_tready is None:
+                # no flow control, word is transferred on the next edge
+                await edge
+            else:
+                while True:
+                    await edge
+                    if s_axis_tready.value.integer == 1:
+                        break
+                    # slave is stalling. Instead of polling every cycle,
+                    # sleep until TREADY goes high and check again at the
+                    # next clock edge
+                    await tready_rising
+
+            if gaps is not None:
                 # with a chance of 20%, insert a clock cycle in which no data
                 # is ready to be transmitted by setting tvalid low
-                if i != len(tdata)-1 and random.random() < 0.2:
-                    self.s_axis_tvalid <= 0
-                    yield RisingEdge(self.clk)
+                if i != last and gaps[i] < 51:
+                    set_tvalid(0)
+                    await edge
+                    set_tvalid(1)
 
-        self.s_axis_tvalid <= 0
-        self.s_axis_tlast <= 0
+        set_tvalid(0)
+        self._set_tlast(0)
 
 
 class AXIS_Reader(object):
@@ -137,16 +187,18 @@ class AXIS_Reader(object):
         """
         self.bit_width = bit_width
 
+        # TKEEP value of a full (non-last) data word
+        self._tkeep_full = (1 << (bit_width // 8)) - 1
+
         if prefix is None:
             sig_prefix = "m_axis"
         else:
             sig_prefix = "m_axis_%s" % prefix
 
         self.clk = clk
-        self.m_axis_tdata = getattr(dut, "%s_tdata" % sig_prefix)
-        self.m_axis_tvalid = getattr(dut, "%s_tvalid" % sig_prefix)
-        self.m_axis_tlast = getattr(dut, "%s_tlast" % sig_prefix)
-        self.m_axis_tkeep = getattr(dut, "%s_tkeep" % sig_prefix)
+        for sig in ("tdata", "tvalid", "tlast", "tkeep"):
+            setattr(self, "m_axis_%s" % sig,
+                    getattr(dut, "%s_%s" % (sig_prefix, sig)))
 
         # flow control (tready) is optional
         try:
@@ -162,15 +214,13 @@ class AXIS_Reader(object):
         except AttributeError:
             self.has_tuser = False
 
-    @cocotb.coroutine
-    def rst(self):
+    async def rst(self):
         """Reset signals."""
         if self.has_tready:
             self.m_axis_tready <= 0
-        yield RisingEdge(self.clk)
+        await RisingEdge(self.clk)
 
-    @cocotb.coroutine
-    def read(self):
+    async def read(self):
         """Perform read on AXI4-Stream master interface.
 
         Reads a complete transfer on the AXI4-Stream master interface. The
@@ -180,6 +230,7 @@ class AXIS_Reader(object):
         """
         # empty tdata list
         tdata = []
+        tdata_append = tdata.append
 
         if self.has_tuser:
             # empty tuser list
@@ -187,22 +238,41 @@ class AXIS_Reader(object):
         else:
             tuser = None
 
+        # bind signal handles to locals for the per-cycle loop
+        has_tready = self.has_tready
+        has_tuser = self.has_tuser
+        m_axis_tdata = self.m_axis_tdata
+        m_axis_tvalid = self.m_axis_tvalid
+        m_axis_tlast = self.m_axis_tlast
+        m_axis_tkeep = self.m_axis_tkeep
+        m_axis_tready = self.m_axis_tready if has_tready else None
+        m_axis_tuser = self.m_axis_tuser if has_tuser else None
+
+        edge = RisingEdge(self.clk)
+
+        tkeep_full = self._tkeep_full
+
         while True:
-            yield RisingEdge(self.clk)
+            await edge
+
+            # sample TVALID first, the remaining signals are only read for
+            # cycles in which a word is actually transferred
+            if not m_axis_tvalid.value.integer:
+                continue
+            if has_tready and not m_axis_tready.value.integer:
+                continue
 
-            if (not self.has_tready or int(self.m_axis_tready)) and \
-                    int(self.m_axis_tvalid):
+            tdata_append(m_axis_tdata.value.integer)
 
-                tdata.append(int(self.m_axis_tdata))
+            if has_tuser:
+                tuser.append(m_axis_tuser.value.integer)
 
-                if self.has_tuser:
-                    tuser.append(int(self.m_axis_tuser))
+            tkeep = m_axis_tkeep.value.integer
 
-                if int(self.m_axis_tlast):
-                    tkeep = int(self.m_axis_tkeep)
-                    break
-                elif int(self.m_axis_tkeep) != pow(2, self.bit_width/8)-1:
-                    raise cocotb.result.TestFailure("invalid AXI4-Stream " +
-                                                    "TKEEP signal value")
+            if m_axis_tlast.value.integer:
+                break
+            elif tkeep != tkeep_full:
+                raise cocotb.result.TestFailure("invalid AXI4-Stream " +
+                                                "TKEEP signal value")
 
-        raise ReturnValue((tdata, tkeep, tuser))
+        return tdata, tkeep, tuser
@@ -28,41 +28,117 @@
 #
 # CRC checksum calculation.
 
-import struct
 
+# CRC16 lookup table for polynomial 0x1021. Entry i is the CRC of byte i, i.e.
+# byte i shifted into the upper half of a zero CRC register and processed bit
+# by bit (MSB first, no reflection)
+_crc16_tab = (
+    0x0000, 0x1021, 0x2042, 0x3063, 0x4084, 0x50a5, 0x60c6, 0x70e7,
+    0x8108, 0x9129, 0xa14a, 0xb16b, 0xc18c, 0xd1ad, 0xe1ce, 0xf1ef,
+    0x1231, 0x0210, 0x3273, 0x2252, 0x52b5, 0x4294, 0x72f7, 0x62d6,
+    0x9339, 0x8318, 0xb37b, 0xa35a, 0xd3bd, 0xc39c, 0xf3ff, 0xe3de,
+    0x2462, 0x3443, 0x0420, 0x1401, 0x64e6, 0x74c7, 0x44a4, 0x5485,
+    0xa56a, 0xb54b, 0x8528, 0x9509, 0xe5ee, 0xf5cf, 0xc5ac, 0xd58d,
+    0x3653, 0x2672, 0x1611, 0x0630, 0x76d7, 0x66f6, 0x5695, 0x46b4,
+    0xb75b, 0xa77a, 0x9719, 0x8738, 0xf7df, 0xe7fe, 0xd79d, 0xc7bc,
+    0x48c4, 0x58e5, 0x6886, 0x78a7, 0x0840, 0x1861, 0x2802, 0x3823,
+    0xc9cc, 0xd9ed, 0xe98e, 0xf9af, 0x8948, 0x9969, 0xa90a, 0xb92b,
+    0x5af5, 0x4ad4, 0x7ab7, 0x6a96, 0x1a71, 0x0a50, 0x3a33, 0x2a12,
+    0xdbfd, 0xcbdc, 0xfbbf, 0xeb9e, 0x9b79, 0x8b58, 0xbb3b, 0xab1a,
+    0x6ca6, 0x7c87, 0x4ce4, 0x5cc5, 0x2c22, 0x3c03, 0x0c60, 0x1c41,
+    0xedae, 0xfd8f, 0xcdec, 0xddcd, 0xad2a, 0xbd0b, 0x8d68, 0x9d49,
+    0x7e97, 0x6eb6, 0x5ed5, 0x4ef4, 0x3e13, 0x2e32, 0x1e51, 0x0e70,
+    0xff9f, 0xefbe, 0xdfdd, 0xcffc, 0xbf1b, 0xaf3a, 0x9f59, 0x8f78,
+    0x9188, 0x81a9, 0xb1ca, 0xa1eb, 0xd10c, 0xc12d, 0xf14e, 0xe16f,
+    0x1080, 0x00a1, 0x30c2, 0x20e3, 0x5004, 0x4025, 0x7046, 0x6067,
+    0x83b9, 0x9398, 0xa3fb, 0xb3da, 0xc33d, 0xd31c, 0xe37f, 0xf35e,
+    0x02b1, 0x1290, 0x22f3, 0x32d2, 0x4235, 0x5214, 0x6277, 0x7256,
+    0xb5ea, 0xa5cb, 0x95a8, 0x8589, 0xf56e, 0xe54f, 0xd52c, 0xc50d,
+    0x34e2, 0x24c3, 0x14a0, 0x0481, 0x7466, 0x6447, 0x5424, 0x4405,
+    0xa7db, 0xb7fa, 0x8799, 0x97b8, 0xe75f, 0xf77e, 0xc71d, 0xd73c,
+    0x26d3, 0x36f2, 0x0691, 0x16b0, 0x6657, 0x7676, 0x4615, 0x5634,
+    0xd94c, 0xc96d, 0xf90e, 0xe92f, 0x99c8, 0x89e9, 0xb98a, 0xa9ab,
+    0x5844, 0x4865, 0x7806, 0x6827, 0x18c0, 0x08e1, 0x3882, 0x28a3,
+    0xcb7d, 0xdb5c, 0xeb3f, 0xfb1e, 0x8bf9, 0x9bd8, 0xabbb, 0xbb9a,
+    0x4a75, 0x5a54, 0x6a37, 0x7a16, 0x0af1, 0x1ad0, 0x2ab3, 0x3a92,
+    0xfd2e, 0xed0f, 0xdd6c, 0xcd4d, 0xbdaa, 0xad8b, 0x9de8, 0x8dc9,
+    0x7c26, 0x6c07, 0x5c64, 0x4c45, 0x3ca2, 0x2c83, 0x1ce0, 0x0cc1,
+    0xef1f, 0xff3e, 0xcf5d, 0xdf7c, 0xaf9b, 0xbfba, 0x8fd9, 0x9ff8,
+    0x6e17, 0x7e36, 0x4e55, 0x5e74, 0x2e93, 0x3eb2, 0x0ed1, 0x1ef0,
+)
 
-def _crc16_initial(c):
-    """Create initial CRC16 table values."""
+
+def _crc16_bytes_py(s):
+    """Return the CRC16 (XMODEM) value of a byte string (pure python)."""
+    tab = _crc16_tab
     crc = 0
-    c = c << 8
-    for j in range(8):
-        if (crc ^ c) & 0x8000:
-            crc = (crc << 1) ^ 0x1021
-        else:
-            crc = crc << 1
-        c = c << 1
+    for c in s:
+        crc = ((crc << 8) ^ tab[((crc >> 8) ^ c) & 0xff]) & 0xffff
     return crc
 
 
-# crc16 table
-_crc16_tab = [_crc16_initial(i) for i in range(256)]
+# CRC16 implementation operating on byte strings. The CRC variant calculated
+# here (polynomial 0x1021, initial value 0, no reflection) is CRC-16/XMODEM.
+# Prefer native implementations: the fastcrc package, then crcmod (only if its
+# C extension is built), then numba-compiled code for long inputs and finally
+# the pure python loop
+try:
+    from fastcrc import crc16 as _fastcrc16
+except ImportError:
+    _fastcrc16 = None
 
+try:
+    import crcmod
+except ImportError:
+    crcmod = None
+else:
+    # crcmod falls back to pure python if its C extension is not built. The
+    # extension module is imported along with the package if it is available
+    if not hasattr(crcmod, "_crcfunext"):
+        crcmod = None
 
-def _crc16_update(crc, c):
-    """CRC16 update function."""
-    c = struct.unpack("B", c)[0]
-    cc = 0xffff & c
-    tmp = (crc >> 8) ^ cc
-    crc = (crc << 8) ^ _crc16_tab[tmp & 0xff]
-    crc = crc & 0xffff
-    return crc
+if _fastcrc16 is not None:
+    _crc16_bytes = _fastcrc16.xmodem
+elif crcmod is not None:
+    _crc16_bytes = crcmod.mkCrcFun(0x11021, initCrc=0, rev=False, xorOut=0)
+else:
+    # numba is only imported if it is actually used, importing it takes
+    # several hundred milliseconds
+    try:
+        import numba
+        import numpy as np
+    except ImportError:
+        numba = None
+
+    if numba is None:
+        _crc16_bytes = _crc16_bytes_py
+    else:
+        # byte strings of at least this length are handed to the
+        # numba-compiled CRC loop. For shorter ones, the call overhead
+        # outweighs the gain
+        _CRC16_JIT_MIN_LEN = 64
+
+        _crc16_tab_np = np.array(_crc16_tab, dtype=np.uint16)
+
+        @numba.njit(cache=True)
+        def _crc16_jit(buf, tab):
+            """Return the CRC16 (XMODEM) value of a uint8 array (compiled)."""
+            crc = 0
+            for c in buf:
+                crc = ((crc << 8) ^ tab[((crc >> 8) ^ c) & 0xff]) & 0xffff
+            return crc
+
+        def _crc16_bytes_jit(s):
+            """Return the CRC16 (XMODEM) value of a byte string (numba)."""
+            if len(s) < _CRC16_JIT_MIN_LEN:
+                return _crc16_bytes_py(s)
+            return int(_crc16_jit(np.frombuffer(s, dtype=np.uint8),
+                                  _crc16_tab_np))
+
+        _crc16_bytes = _crc16_bytes_jit
 
 
 def crc16(i):
     """Return the CRC16 value for a given key."""
-    h = '%x' % i
-    s = ('0'*(len(h) % 2) + h).decode('hex')
-    crc = 0
-    for c in s:
-        crc = _crc16_update(crc, c)
-    return crc
+    # big-endian bytes of the key, at least one byte (for key 0)
+    return _crc16_bytes(i.to_bytes((i.bit_length() + 7) // 8 or 1, 'big'))
@@ -31,6 +31,16 @@
 # DUT directly.
 
 import mmap
+import struct
+
+# supported access pattern hints, see File.__init__()
+_MADVISE_HINTS = ("normal", "random", "sequential", "willneed")
+
+# unpack functions for unsigned integers of native sizes, indexed by size
+_UNPACK_BIG = {size: struct.Struct('>' + fmt).unpack_from
+               for size, fmt in ((1, 'B'), (2, 'H'), (4, 'I'), (8, 'Q'))}
+_UNPACK_LITTLE = {size: struct.Struct('<' + fmt).unpack_from
+                  for size, fmt in ((1, 'B'), (2, 'H'), (4, 'I'), (8, 'Q'))}
 
 
 class File(object):
@@ -39,15 +49,45 @@ class File(object):
     Reads an input file and allows memory-mapped access.
     """
 
-    def __init__(self, filename):
+    def __init__(self, filename, madvise_hint=None, populate=False):
         """Initialize.
 
         Initializes the object. Expects parameter providing the name of the
-        file that shall be read.
+        file that shall be read. Optionally, the expected access pattern can
+        be passed to the kernel via 'madvise_hint' ('normal', 'random',
+        'sequential' or 'willneed') to tune the readahead of file pages. If
+        'populate' is set to True, all pages of the file are loaded when the
+        file is opened (instead of on first access during simulation).
         """
+        if madvise_hint is not None and madvise_hint not in _MADVISE_HINTS:
+            raise ValueError("invalid madvise hint '%s'" % madvise_hint)
+
         # open file and mmap it
         self._file = open(filename, "r+b")
-        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        if populate and hasattr(mmap, "MAP_POPULATE"):
+            # let the kernel prefault the page tables of the mapping (Linux)
+            self._mm = mmap.mmap(self._file.fileno(), 0,
+                                 flags=mmap.MAP_SHARED | mmap.MAP_POPULATE,
+                                 prot=mmap.PROT_READ)
+        else:
+            self._mm = mmap.mmap(self._file.fileno(), 0,
+                                 access=mmap.ACCESS_READ)
+            if populate:
+                # at least ask the kernel to read in the file pages
+                self._madvise("willneed")
+
+        if madvise_hint is not None:
+            self._madvise(madvise_hint)
+
+    def _madvise(self, hint):
+        """Pass an access pattern hint for the mapped file to the kernel."""
+        # the hint is optional, ignore platforms that do not support it
+        advice = getattr(mmap, "MADV_%s" % hint.upper(), None)
+        if advice is not None and hasattr(self._mm, "madvise"):
+            try:
+                self._mm.madvise(advice)
+            except OSError:
+                pass
 
     def close(self):
         """Close file."""
@@ -56,17 +96,49 @@ class File(object):
 
     def read(self, addr, size):
         """Read data from the file (integer in original byte order)."""
-        return int("".join(self._mm[addr:addr+size]).encode('hex'), 16)
+        unpack = _UNPACK_BIG.get(size)
+        if unpack is not None:
+            # unpack directly from the mmap without copying a slice first
+            try:
+                return unpack(self._mm, addr)[0]
+            except struct.error:
+                pass  # read beyond end of file, fall back to slicing
+        return int.from_bytes(self.read_bytes(addr, size), 'big')
 
     def read_reverse_byte_order(self, addr, size):
         """Read data from the file (integer in reversed byte order)."""
-        # read data and convert to hex string
-        data = "".join(self._mm[addr:addr+size]).encode('hex')
+        unpack = _UNPACK_LITTLE.get(size)
+        if unpack is not None:
+            try:
+                return unpack(self._mm, addr)[0]
+            except struct.error:
+                pass
+        return int.from_bytes(self.read_bytes(addr, size), 'little')
 
-        # reverse byte order
-        data = "".join(reversed([data[i:i+2] for i in range(0, len(data), 2)]))
+    def read_bytes(self, addr, size):
+        """Read data from the file (raw bytes)."""
+        return self._mm[addr:addr+size]
 
-        return int(data, 16)
+    def read_view(self, addr, size):
+        """Return a read-only view on data of the file without copying it.
+
+        The returned memoryview must be released before the file is closed.
+        """
+        return memoryview(self._mm)[addr:addr+size]
+
+    def readinto(self, buf, addr, size):
+        """Copy data from the file into a preallocated buffer.
+
+        Copies 'size' bytes starting at file address 'addr' to the beginning
+        of 'buf' (e.g. a bytearray), without allocating an intermediate bytes
+        object. Returns the number of copied bytes, which is less than 'size'
+        if the end of the file or the end of 'buf' is reached.
+        """
+        with memoryview(self._mm) as mv, memoryview(buf) as dst:
+            # never copy more than fits, slice assignment must not resize buf
+            n = min(len(mv[addr:addr+size]), len(dst))
+            dst[:n] = mv[addr:addr+n]
+        return n
 
     def size(self):
         """Return the size of the mmaped file."""
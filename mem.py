@@ -29,11 +29,15 @@
 # Memory module. Acts as a simplified AXI4 slave and allows attached DuTs to
 # read and write data from/to a specific memory location.
 
-import cocotb
 from cocotb.triggers import RisingEdge
 from tb import wait_n_cycles
+import numpy as np
+from itertools import cycle
 import random
 
+# number of random delays that are precomputed by Mem.connect()
+_DELAY_RING_SIZE = 4096
+
 
 class Mem(object):
     """Memory module.
@@ -44,20 +48,22 @@ class Mem(object):
 
     def __init__(self, size, offset=0):
         """Initialize an empty memory with the specified byte size."""
-        # initialize empty memory
-        self._data = ['\x00'] * size
+        # initialize empty memory. The content is kept in a contiguous numpy
+        # byte array, which allows bulk transfers on slices of the memory
+        self._data = np.zeros(size, dtype=np.uint8)
         self._offset = offset
 
+        # scalar reads/writes go through a memoryview of the array, which is
+        # much cheaper than numpy slicing for a few bytes
+        self._mv = memoryview(self._data)
+
     def write(self, addr, data, size):
         """Write data to the memory."""
         assert addr >= self._offset
         addr -= self._offset
         assert (addr + size) <= self.size()
 
-        # convert to hex string
-        data = "{0:0{1}x}".format(data, 2*size)
-
-        self._data[addr:addr+size] = data.decode('hex')
+        self._mv[addr:addr+size] = data.to_bytes(size, 'big')
 
     def write_reverse_byte_order(self, addr, data, size):
         """Write data to the memory (reverse byte order)."""
@@ -65,13 +71,7 @@ class Mem(object):
         addr -= self._offset
         assert (addr + size) <= self.size()
 
-        # convert to hex string
-        data = "{0:0{1}x}".format(data, 2*size)
-
-        # reverse byte order
-        data = "".join(reversed([data[i:i+2] for i in range(0, len(data), 2)]))
-
-        self._data[addr:addr+size] = data.decode('hex')
+        self._mv[addr:addr+size] = data.to_bytes(size, 'little')
 
     def read(self, addr, size):
         """Read data from the memory."""
@@ -79,24 +79,28 @@ class Mem(object):
         addr -= self._offset
         assert (addr + size) <= self.size()
 
-        return int("".join(self._data[addr:addr+size]).encode('hex'), 16)
+        return int.from_bytes(self._mv[addr:addr+size], 'big')
 
     def read_reverse_byte_order(self, addr, size):
         """Read data from the memory (reverse byte order)."""
-        # read data
-        data = self.read(addr, size)
+        assert addr >= self._offset
+        addr -= self._offset
+        assert (addr + size) <= self.size()
 
-        # convert to hex string
-        data = "{0:0{1}x}".format(data, 2*size)
+        return int.from_bytes(self._mv[addr:addr+size], 'little')
 
-        # reverse byte order
-        data = "".join(reversed([data[i:i+2] for i in range(0, len(data), 2)]))
+    def read_bytes(self, addr, size):
+        """Read data from the memory (raw bytes)."""
+        assert addr >= self._offset
+        addr -= self._offset
+        assert (addr + size) <= self.size()
 
-        return int(data, 16)
+        return self._mv[addr:addr+size].tobytes()
 
     def set_size(self, size):
         """Update the memory size."""
-        self._data = ['\x00'] * size
+        self._data = np.zeros(size, dtype=np.uint8)
+        self._mv = memoryview(self._data)
 
     def set_offset(self, offset):
         """Update the memory offset address."""
@@ -108,8 +112,7 @@ class Mem(object):
 
     def clear(self):
         """Clear the memory content."""
-        for i in range(len(self._data)):
-            self._data[i] = '\x00'
+        self._data.fill(0)
 
     def connect(self, dut, prefix=None):
         """Connect DuT to the AXI4 slave interface of the memory module."""
@@ -120,33 +123,30 @@ class Mem(object):
 
         self._CLK = dut.clk
 
-        # read interface
-        self._ARADDR = getattr(dut, "%s_araddr" % sig_prefix)
-        self._ARLEN = getattr(dut, "%s_arlen" % sig_prefix)
-        self._ARSIZE = getattr(dut, "%s_arsize" % sig_prefix)
-        self._ARVALID = getattr(dut, "%s_arvalid" % sig_prefix)
-        self._ARREADY = getattr(dut, "%s_arready" % sig_prefix)
-        self._RREADY = getattr(dut, "%s_rready" % sig_prefix)
-        self._RDATA = getattr(dut, "%s_rdata" % sig_prefix)
-        self._RLAST = getattr(dut, "%s_rlast" % sig_prefix)
-        self._RVALID = getattr(dut, "%s_rvalid" % sig_prefix)
-
-        # write interface
-        self._AWADDR = getattr(dut, "%s_awaddr" % sig_prefix)
-        self._AWLEN = getattr(dut, "%s_awlen" % sig_prefix)
-        self._AWSIZE = getattr(dut, "%s_awsize" % sig_prefix)
-        self._AWVALID = getattr(dut, "%s_awvalid" % sig_prefix)
-        self._AWREADY = getattr(dut, "%s_awready" % sig_prefix)
-        self._WREADY = getattr(dut, "%s_wready" % sig_prefix)
-        self._WDATA = getattr(dut, "%s_wdata" % sig_prefix)
-        self._WLAST = getattr(dut, "%s_wlast" % sig_prefix)
-        self._WVALID = getattr(dut, "%s_wvalid" % sig_prefix)
-        self._BRESP = getattr(dut, "%s_bresp" % sig_prefix)
-        self._BVALID = getattr(dut, "%s_bvalid" % sig_prefix)
-        self._BREADY = getattr(dut, "%s_bready" % sig_prefix)
-
-    @cocotb.coroutine
-    def main(self):
+        # read and write interface, e.g. DuT signal m_axi_araddr is stored
+        # as self._ARADDR
+        for sig in ("araddr", "arlen", "arsize", "arvalid", "arready",
+                    "rready", "rdata", "rlast", "rvalid",
+                    "awaddr", "awlen", "awsize", "awvalid", "awready",
+                    "wready", "wdata", "wlast", "wvalid",
+                    "bresp", "bvalid", "bready"):
+            setattr(self, "_%s" % sig.upper(),
+                    getattr(dut, "%s_%s" % (sig_prefix, sig)))
+
+        # precompute rings of random delays (in clock cycles), which main()
+        # cycles through instead of calling the random number generator
+        # for every transaction and beat:
+        # - delays before acknowledging requests and starting bursts
+        # - gaps between beats of a read burst
+        # - number of cycles WREADY is kept low after a write beat (with a
+        #   chance of 10%, 1 to 5 cycles)
+        randint = random.randint
+        self._req_delays = [randint(0, 10) for _ in range(_DELAY_RING_SIZE)]
+        self._beat_gaps = [randint(0, 5) for _ in range(_DELAY_RING_SIZE)]
+        self._wready_holds = [randint(1, 5) if randint(0, 9) == 0 else 0
+                              for _ in range(_DELAY_RING_SIZE)]
+
+    async def main(self):
         """Handle AXI4 slave read/write interface.
 
         Allows attached DUT to read/write memory content via an AXI interface.
@@ -164,141 +164,180 @@ class Mem(object):
         # initially BVALID is low
         self._BVALID <= 0
 
+        # bind clock and signal handles to locals for the per-cycle loops
+        CLK = self._CLK
+        ARADDR, ARLEN, ARSIZE = self._ARADDR, self._ARLEN, self._ARSIZE
+        ARVALID, ARREADY = self._ARVALID, self._ARREADY
+        RDATA, RVALID, RLAST, RREADY = \
+            self._RDATA, self._RVALID, self._RLAST, self._RREADY
+        AWADDR, AWLEN, AWSIZE = self._AWADDR, self._AWLEN, self._AWSIZE
+        AWVALID, AWREADY = self._AWVALID, self._AWREADY
+        WDATA, WVALID, WLAST, WREADY = \
+            self._WDATA, self._WVALID, self._WLAST, self._WREADY
+        BRESP, BVALID, BREADY = self._BRESP, self._BVALID, self._BREADY
+
+        edge = RisingEdge(CLK)
+        next_req_delay = cycle(self._req_delays).__next__
+        next_beat_gap = cycle(self._beat_gaps).__next__
+        next_wready_hold = cycle(self._wready_holds).__next__
+
         while True:  # infinite loop
             read = False
             write = False
 
             # wait for read/write request
             while True:
-                yield RisingEdge(self._CLK)
+                await edge
 
                 # read requests are served before write requests
-                if int(self._ARVALID):
+                if ARVALID.value.integer:
                     read = True
                     break
 
-                if int(self._AWVALID):
+                if AWVALID.value.integer:
                     write = True
                     break
 
-            # wait a random number of cycles
-            yield wait_n_cycles(self._CLK, random.randint(0, 10))
+            # wait a random number of cycles (skip zero-cycle waits)
+            n = next_req_delay()
+            if n:
+                await wait_n_cycles(CLK, n)
 
             if read:
                 # acknowledge read request
-                self._ARREADY <= 1
+                ARREADY <= 1
 
                 # ARVALID should still be high, but let's explicitly wait and
                 # check anyways
                 while True:
-                    yield RisingEdge(self._CLK)
-                    if int(self._ARVALID):
+                    await edge
+                    if ARVALID.value.integer:
                         break
 
                 # save address and burst information
-                araddr = int(self._ARADDR)
-                arlen = int(self._ARLEN)
-                arsize = int(self._ARSIZE)
+                araddr = ARADDR.value.integer
+                arlen = ARLEN.value.integer
+                arsize = ARSIZE.value.integer
 
                 # deassert ARREADY
-                self._ARREADY <= 0
-
-                # wait a random number of cycles
-                yield wait_n_cycles(self._CLK, random.randint(0, 10))
-
-                # start answering read request
+                ARREADY <= 0
+
+                # wait a random number of cycles (skip zero-cycle waits)
+                n = next_req_delay()
+                if n:
+                    await wait_n_cycles(CLK, n)
+
+                # read the data of the complete burst at once and split it up
+                # into beats (reverse byte order) before entering the
+                # cycle-by-cycle loop
+                beat_size = 1 << arsize
+                assert araddr >= self._offset
+                addr = araddr - self._offset
+                burst_size = (arlen+1) * beat_size
+                assert (addr + burst_size) <= self.size()
+                raw = self._mv[addr:addr+burst_size].tobytes()
+                beats = [int.from_bytes(raw[j:j+beat_size], 'little')
+                         for j in range(0, burst_size, beat_size)]
+
+                # start answering read request. Beats are transferred back to
+                # back, RVALID is only driven low for gaps between beats
+                RVALID <= 1
+                RLAST <= 0
                 for i in range(arlen+1):
                     # read data for current burst
-                    self._RDATA <= \
-                            self.read_reverse_byte_order(
-                                    araddr+i*pow(2, arsize), pow(2, arsize))
-
-                    # data is valid
-                    self._RVALID <= 1
+                    RDATA <= beats[i]
 
                     # set rlast signal high for last beat of the burst
                     if i == arlen:
-                        self._RLAST <= 1
-                    else:
-                        self._RLAST <= 0
+                        RLAST <= 1
 
                     # wait for requestor to get ready to accept data
                     while True:
-                        yield RisingEdge(self._CLK)
-                        if int(self._RREADY) == 1:
+                        await edge
+                        if RREADY.value.integer == 1:
                             break
 
-                    # set data to be not valid anymore
-                    self._RVALID <= 0
-
                     # insert some random gaps between beats of the same burst
                     if i != arlen:
-                        yield wait_n_cycles(self._CLK, random.randint(0, 5))
+                        n = next_beat_gap()
+                        if n:
+                            RVALID <= 0
+                            await wait_n_cycles(CLK, n)
+                            RVALID <= 1
+
+                # set data to be not valid anymore
+                RVALID <= 0
 
             elif write:
                 # acknowledge write request
-                self._AWREADY <= 1
+                AWREADY <= 1
 
                 # AWVALID should still be high, but let's explicitly wait and
                 # check anyways
                 while True:
-                    yield RisingEdge(self._CLK)
-                    if int(self._AWVALID):
+                    await edge
+                    if AWVALID.value.integer:
                         break
 
                 # save address and burst information
-                awaddr = int(self._AWADDR)
-                awlen = int(self._AWLEN)
-                awsize = int(self._AWSIZE)
+                awaddr = AWADDR.value.integer
+                awlen = AWLEN.value.integer
+                awsize = AWSIZE.value.integer
 
                 # deassert AWREADY
-                self._AWREADY <= 0
+                AWREADY <= 0
+
+                # wait a random number of cycles (skip zero-cycle waits)
+                n = next_req_delay()
+                if n:
+                    await wait_n_cycles(CLK, n)
 
-                # wait a random number of cycles
-                yield wait_n_cycles(self._CLK, random.randint(0, 10))
+                # number of bytes per beat, address of the first beat
+                beat_size = 1 << awsize
+                addr = awaddr
 
                 # start write
                 for i in range(awlen+1):
                     # accept data
-                    self._WREADY <= 1
+                    WREADY <= 1
 
                     # wait for WVALID to become high
                     while True:
-                        yield RisingEdge(self._CLK)
-                        if int(self._WVALID):
+                        await edge
+                        if WVALID.value.integer:
                             break
 
                     # get data
-                    data = int(self._WDATA)
+                    data = WDATA.value.integer
 
                     # write data
-                    self.write_reverse_byte_order(
-                            awaddr+i*pow(2, awsize), data, pow(2, awsize))
+                    self.write_reverse_byte_order(addr, data, beat_size)
+                    addr += beat_size
 
                     # check wlast signal
                     if i == awlen:
-                        assert int(self._WLAST) == 1
+                        assert WLAST.value.integer == 1
                     else:
-                        assert int(self._WLAST) == 0
+                        assert WLAST.value.integer == 0
 
                     # set WREADY back low
-                    self._WREADY <= 0
+                    WREADY <= 0
 
                     # randomly keep WREADY low sometimes for a bit
                     if i != awlen:
-                        if random.random() < 0.1:
-                            yield wait_n_cycles(self._CLK,
-                                                random.randint(1, 5))
+                        n = next_wready_hold()
+                        if n:
+                            await wait_n_cycles(CLK, n)
 
                 # set BRESP and BVALID
-                self._BRESP <= 0
-                self._BVALID <= 1
+                BRESP <= 0
+                BVALID <= 1
 
                 # wait for BREADY to become high
                 while True:
-                    yield RisingEdge(self._CLK)
-                    if int(self._BREADY):
+                    await edge
+                    if BREADY.value.integer:
                         break
 
                 # set BVALID back low
-                self._BVALID <= 0
+                BVALID <= 0
@@ -28,11 +28,11 @@
 #
 # Provides some handy network related functions.
 
-from scapy.all import Ether, IP, IPv6, RandIP, RandIP6, TCP, UDP
-from math import log
-from array import array
-from netaddr import IPAddress
-from random import randint, random
+from scapy.all import Ether, IP, IPv6, TCP, UDP
+import struct
+import socket
+from random import randint, random, getrandbits
+import numpy as np
 
 
 def gen_packet(eth_only=False, size=None):
@@ -47,27 +47,27 @@ def gen_packet(eth_only=False, size=None):
     pkt = Ether(src="53:00:00:00:00:01", dst="53:00:00:00:00:02")
 
     if not eth_only:  # encapsulate IP packet
-        if randint(0, 1) == 0:
-            pkt /= IP(src=RandIP()._fix(), dst=RandIP()._fix())
+        if getrandbits(1) == 0:
+            pkt /= IP(src=_rand_ipv4(), dst=_rand_ipv4())
         else:
-            pkt /= IPv6(src=RandIP6()._fix(), dst=RandIP6()._fix())
+            pkt /= IPv6(src=_rand_ipv6(), dst=_rand_ipv6())
 
         if IP in pkt:  # generated packet L3 is IPv4
             rand = random()
             if rand < 0.1:
                 # mark some packets as fragments
-                if randint(0, 1) == 0:
+                if getrandbits(1) == 0:
                     pkt[IP].flags = 1  # set MF flag
                 else:
                     pkt[IP].frag = randint(1, 2**13-1)  # frag offset
             elif rand < 0.8:
                 # encapsulate TCP / UDP payload in some more
-                if randint(0, 1) == 0:
-                    pkt /= TCP(sport=randint(0, 2**16-1),
-                               dport=randint(0, 2**16-1))
+                if getrandbits(1) == 0:
+                    pkt /= TCP(sport=getrandbits(16),
+                               dport=getrandbits(16))
                 else:
-                    pkt /= UDP(sport=randint(0, 2**16-1),
-                               dport=randint(0, 2**16-1))
+                    pkt /= UDP(sport=getrandbits(16),
+                               dport=getrandbits(16))
             else:
                 # do not encapsulate anything in all others
                 pass
@@ -76,42 +76,225 @@ def gen_packet(eth_only=False, size=None):
             rand = random()
             if rand < 0.8:
                 # encapsulate TCP / UDP payload in some more
-                if randint(0, 1) == 0:
-                    pkt /= TCP(sport=randint(0, 2**16-1),
-                               dport=randint(0, 2**16-1))
+                if getrandbits(1) == 0:
+                    pkt /= TCP(sport=getrandbits(16),
+                               dport=getrandbits(16))
                 else:
-                    pkt /= UDP(sport=randint(0, 2**16-1),
-                               dport=randint(0, 2**16-1))
+                    pkt /= UDP(sport=getrandbits(16),
+                               dport=getrandbits(16))
             else:
                 # encapsulate nothing
                 pass
 
     # append some random payload
     if size is not None:
-        pkt /= ''.join(chr(randint(0, 255)) for _ in range(size-len(pkt)))
+        pkt /= _rand_bytes(max(size-len(pkt), 0))
     else:
-        pkt /= ''.join(chr(randint(0, 255)) for _ in
-                       range(randint(50, 1000)))
+        pkt /= _rand_bytes(randint(50, 1000))
 
     return pkt
 
 
+def _rand_ipv4():
+    """Return a random IPv4 address string."""
+    return socket.inet_ntoa(getrandbits(32).to_bytes(4, 'big'))
+
+
+def _rand_ipv6():
+    """Return a random IPv6 address string."""
+    addr = getrandbits(128).to_bytes(16, 'big')
+    return socket.inet_ntop(socket.AF_INET6, addr)
+
+
+def _rand_bytes(n):
+    """Return a random byte string of length n.
+
+    All bytes are drawn at once from the (seedable) module-level random
+    number generator instead of one randint() call per byte.
+    """
+    return getrandbits(8*n).to_bytes(n, 'little')
+
+
+# fixed MAC addresses of generated packets
+_ETH_SRC = bytes.fromhex("530000000001")
+_ETH_DST = bytes.fromhex("530000000002")
+
+
+def _inet_checksum(data):
+    """Return the internet checksum (RFC 1071) of a byte string."""
+    if len(data) % 2:
+        data += b'\x00'
+    # 2**16 mod 0xFFFF is 1, so the one's complement sum of the 16 bit words
+    # equals the data (as an integer) mod 0xFFFF. A non-zero multiple of
+    # 0xFFFF sums up to 0xFFFF (negative zero)
+    x = int.from_bytes(data, 'big')
+    s = x % 0xFFFF
+    if s == 0 and x != 0:
+        s = 0xFFFF
+    return ~s & 0xFFFF
+
+
+def gen_packet_raw(eth_only=False, size=None):
+    """Generate a random network packet as a byte string.
+
+    Same as gen_packet(), but the packet headers are packed directly instead
+    of being built by Scapy, which is much faster. Use this function if the
+    raw packet data is sufficient. Header fields that are not randomized are
+    set to the same values Scapy would use. If required, the returned byte
+    string can be parsed by Scapy via Ether(pkt).
+    """
+    return _gen_packet_raw(eth_only, size)[0]
+
+
+def gen_packet_bundle(datapath_bit_width, key, keylen, eth_only=False,
+                      size=None):
+    """Generate a random network packet, its AXI-Stream data and hash value.
+
+    Combines gen_packet_raw(), packet_to_axis_data() and calc_toeplitz_hash()
+    in one call. The Toeplitz hash input is taken from the header fields while
+    the packet is generated, so the packet is never parsed. Returns a tuple
+    consisting of the packet (byte string), the list of TDATA words, the
+    TKEEP signal value for the last TDATA word and the hash value.
+    """
+    pkt, hash_data = _gen_packet_raw(eth_only, size)
+    tdata, tkeep = packet_to_axis_data(pkt, datapath_bit_width)
+    if hash_data:
+        hashval = _toeplitz_hash(hash_data, key, keylen)
+    else:
+        hashval = 0  # non-IP packet
+    return (pkt, tdata, tkeep, hashval)
+
+
+def _gen_packet_raw(eth_only, size):
+    """Generate a random network packet as a byte string.
+
+    Returns the packet and the input data for the Toeplitz hash function as
+    defined by calc_toeplitz_hash() (empty for non-IP packets).
+    """
+    l3 = None  # 4 (IPv4), 6 (IPv6) or None (Ethernet frame only)
+    l4 = None  # 6 (TCP), 17 (UDP) or None
+    ip_flags = 0
+    ip_frag = 0
+
+    if not eth_only:  # encapsulate IP packet
+        if getrandbits(1) == 0:
+            l3 = 4
+            ip_src = getrandbits(32).to_bytes(4, 'big')
+            ip_dst = getrandbits(32).to_bytes(4, 'big')
+        else:
+            l3 = 6
+            ip_src = getrandbits(128).to_bytes(16, 'big')
+            ip_dst = getrandbits(128).to_bytes(16, 'big')
+
+        rand = random()
+        if l3 == 4 and rand < 0.1:
+            # mark some IPv4 packets as fragments
+            if getrandbits(1) == 0:
+                ip_flags = 1  # set MF flag
+            else:
+                ip_frag = randint(1, 2**13-1)  # frag offset
+        elif rand < 0.8:
+            # encapsulate TCP / UDP payload in some more
+            l4 = 6 if getrandbits(1) == 0 else 17
+            sport = getrandbits(16)
+            dport = getrandbits(16)
+
+    # header lengths
+    if l3 is None:
+        l3_hdr_len = 0
+    else:
+        l3_hdr_len = 20 if l3 == 4 else 40
+    if l4 is None:
+        l4_hdr_len = 0
+    else:
+        l4_hdr_len = 20 if l4 == 6 else 8
+    hdr_len = 14 + l3_hdr_len + l4_hdr_len
+
+    # random payload
+    if size is not None:
+        n_payload = max(size - hdr_len, 0)
+    else:
+        n_payload = randint(50, 1000)
+    data = _rand_bytes(n_payload)
+
+    # Toeplitz hash input: IP addresses and (for TCP/UDP) ports. Fragments
+    # never carry a TCP/UDP header here
+    if l3 is None:
+        hash_data = b''
+    elif l4 is None:
+        hash_data = ip_src + ip_dst
+    else:
+        hash_data = ip_src + ip_dst + struct.pack('!HH', sport, dport)
+
+    if l4 is not None:
+        l4_len = l4_hdr_len + n_payload
+        if l3 == 4:
+            pseudo_hdr = struct.pack('!4s4sBBH', ip_src, ip_dst, 0, l4, l4_len)
+        else:
+            pseudo_hdr = struct.pack('!16s16sIxxxB', ip_src, ip_dst, l4_len,
+                                     l4)
+        if l4 == 6:
+            # TCP: seq/ack 0, data offset 5, SYN flag, window 8192
+            hdr = struct.pack('!HHIIBBH', sport, dport, 0, 0, 0x50, 0x02,
+                              8192)
+            chksum = _inet_checksum(pseudo_hdr + hdr + bytes(4) + data)
+            data = hdr + struct.pack('!HH', chksum, 0) + data
+        else:
+            hdr = struct.pack('!HHH', sport, dport, l4_len)
+            chksum = _inet_checksum(pseudo_hdr + hdr + bytes(2) + data)
+            # a checksum of zero is transmitted as all ones for UDP
+            data = hdr + struct.pack('!H', chksum or 0xFFFF) + data
+
+    if l3 == 4:
+        # IPv4: id 1, TTL 64, IP protocol 0 if nothing is encapsulated
+        hdr = struct.pack('!BBHHHBB', 0x45, 0, 20 + len(data), 1,
+                          (ip_flags << 13) | ip_frag, 64, l4 or 0)
+        chksum = _inet_checksum(hdr + bytes(2) + ip_src + ip_dst)
+        data = hdr + struct.pack('!H', chksum) + ip_src + ip_dst + data
+        ethertype = 0x0800
+    elif l3 == 6:
+        # IPv6: hop limit 64, next header 59 (none) if nothing is
+        # encapsulated
+        data = struct.pack('!IHBB16s16s', 6 << 28, len(data), l4 or 59, 64,
+                           ip_src, ip_dst) + data
+        ethertype = 0x86DD
+    else:
+        ethertype = 0x9000
+
+    return (struct.pack('!6s6sH', _ETH_DST, _ETH_SRC, ethertype) + data,
+            hash_data)
+
+
 def packet_to_axis_data(pkt, datapath_bit_width):
     """Convert packet to AXI-Stream data.
 
     Converts a Scapy packet to AXI-Stream data. The function returns a list
     of datapath_bit_width-wide TDATA words and the TKEEP signal that shall be
-    placed on the interconnect for the last TDATA word.
+    placed on the interconnect for the last TDATA word. Instead of a Scapy
+    packet, the raw packet data may be passed as a byte string (e.g. as
+    returned by gen_packet_raw() or a previous bytes(pkt) call), in which case
+    the packet is not built by Scapy again.
     """
-    pkt_str = str(pkt)
-    tdata = []
-
-    while len(pkt_str) > 0:
-        data_len = min(datapath_bit_width/8, len(pkt_str))
-        tdata.append(pkt_str[0:data_len])
-        pkt_str = pkt_str[data_len:]
-        tkeep = 2**data_len-1
-    tdata = map(lambda x: int(x[::-1].encode('hex'), 16), tdata)
+    if isinstance(pkt, bytes):
+        pkt_bytes = pkt
+    else:
+        # builds the packet (including checksums etc.) in case of Scapy
+        pkt_bytes = bytes(pkt)
+    word_bytes = datapath_bit_width // 8
+    n_bytes = len(pkt_bytes)
+
+    # the last word holds the remaining bytes, one TKEEP bit per byte
+    tkeep = (1 << (n_bytes % word_bytes or word_bytes)) - 1
+
+    # zero-pad the packet to full words. The first byte of a word is placed
+    # on the least significant byte lane of TDATA
+    padded = pkt_bytes + bytes(-n_bytes % word_bytes)
+    if word_bytes in (1, 2, 4, 8):
+        # words fit into native little-endian integers
+        tdata = np.frombuffer(padded, dtype="<u%d" % word_bytes).tolist()
+    else:
+        tdata = [int.from_bytes(padded[i:i+word_bytes], 'little')
+                 for i in range(0, len(padded), word_bytes)]
     return (tdata, tkeep)
 
 
@@ -122,16 +305,23 @@ def axis_data_to_packet(tdata, tkeep, datapath_bit_width):
     datapath_bit_width-wide TDATA words and the TKEEP signal that was placed
     on the interconnect for the last TDATA word.
     """
-    pkt_data = array('B')
+    word_bytes = datapath_bit_width // 8
+    last = len(tdata) - 1
+    last_n_bytes = (tkeep + 1).bit_length() - 1
+
+    # allocate the packet buffer once and copy the words into place
+    pkt_data = bytearray(last * word_bytes + last_n_bytes)
+    offset = 0
     for i, tdata_word in enumerate(tdata):
-        if i == len(tdata)-1:
-            n_bytes = int(log(tkeep+1, 2))
-        else:
-            n_bytes = datapath_bit_width/8
-        for _ in range(n_bytes):
-            pkt_data.append(tdata_word & 0xFF)
-            tdata_word >>= 8
-    return Ether(pkt_data.tostring())
+        n_bytes = last_n_bytes if i == last else word_bytes
+        # first byte of the packet is placed on the least significant byte
+        # lane of TDATA. Byte lanes beyond n_bytes (null bytes according to
+        # TKEEP) may carry arbitrary data, mask them out
+        end = offset + n_bytes
+        pkt_data[offset:end] = \
+            (tdata_word & ((1 << (8*n_bytes)) - 1)).to_bytes(n_bytes, 'little')
+        offset = end
+    return Ether(bytes(pkt_data))
 
 
 def calc_toeplitz_hash(pkt, key, keylen):
@@ -149,38 +339,103 @@ def calc_toeplitz_hash(pkt, key, keylen):
 
     For non-IP packets, a hash value of zero is returned
     """
+    # find the L3 layer (and below the L4 layer) in a single walk along the
+    # layer chain of the packet
+    l3 = pkt
+    while l3 and type(l3) is not IP and type(l3) is not IPv6:
+        l3 = l3.payload
+
     # return zero for non-IP packets
-    if IP not in pkt and IPv6 not in pkt:
+    if not l3:
         return 0
 
-    if IP in pkt:  # L3 is IPv4
-        data = int(IPAddress(pkt[IP].src)) << 32
-        data |= int(IPAddress(pkt[IP].dst))
-        l3 = IP
-        datalen = 64
-    elif IPv6 in pkt:  # L3 is IPv6
-        data = int(IPAddress(pkt[IPv6].src, 6)) << 128
-        data |= int(IPAddress(pkt[IPv6].dst, 6))
-        l3 = IPv6
-        datalen = 256
-
-    if l3 == IP and (pkt[IP].flags == 1 or pkt[IP].frag != 0):
-        # for fragmented packets, only hash IPv4 header
-        pass
-    elif TCP in pkt[l3]:  # L4 is TCP
-        data = (data << 32) | (pkt[l3][TCP].sport << 16) | pkt[l3][TCP].dport
-        datalen += 32
-    elif UDP in pkt[l3]:  # L4 is UDP
-        data = (data << 32) | (pkt[l3][UDP].sport << 16) | pkt[l3][UDP].dport
-        datalen += 32
-
-    # initialize hash value
-    hashval = 0
-
-    # do the hashing
-    for i in range(datalen):
-        if data & (1 << i):
-            hashval ^= (key >> (keylen * 8 - 32 -
-                                (datalen - i) + 1)) & 0xFFFFFFFF
-
-    return hashval
+    # hash input: source and destination IP addresses, followed by TCP/UDP
+    # source and destination ports
+    if type(l3) is IP:  # L3 is IPv4
+        data = socket.inet_aton(l3.src) + socket.inet_aton(l3.dst)
+        if l3.flags == 1 or l3.frag != 0:
+            # for fragmented packets, only hash IPv4 header
+            return _toeplitz_hash(data, key, keylen)
+    else:  # L3 is IPv6
+        data = (socket.inet_pton(socket.AF_INET6, l3.src) +
+                socket.inet_pton(socket.AF_INET6, l3.dst))
+
+    l4 = l3.payload
+    while l4 and type(l4) is not TCP and type(l4) is not UDP:
+        l4 = l4.payload
+    if l4:  # L4 is TCP or UDP
+        data += struct.pack('!HH', l4.sport, l4.dport)
+
+    return _toeplitz_hash(data, key, keylen)
+
+
+def _toeplitz_hash(data, key, keylen):
+    """Return the Toeplitz hash value of a byte string (hash input)."""
+    # XOR the key windows of all data bits that are set
+    datalen = 8 * len(data)
+    windows = _get_toeplitz_table(key, keylen, datalen)
+    data_bytes = np.frombuffer(data, dtype=np.uint8)
+    kernel = _toeplitz_kernel or _get_toeplitz_kernel()
+    return int(kernel(data_bytes, windows, datalen))
+
+
+def _toeplitz_np(data_bytes, key_words, nbits):
+    """Return the Toeplitz hash value of a uint8 array (vectorized)."""
+    bits = np.unpackbits(data_bytes)
+    return np.bitwise_xor.reduce(key_words[bits.astype(bool)])
+
+
+# Toeplitz hashing function, selected on first use by _get_toeplitz_kernel()
+_toeplitz_kernel = None
+
+
+def _get_toeplitz_kernel():
+    """Select the function that calculates Toeplitz hash values.
+
+    If numba is available, the hashing loop is compiled instead of running the
+    vectorized numpy version, which needs several temporary arrays per packet.
+    numba is only imported once a hash value is actually calculated, since
+    importing it takes several hundred milliseconds.
+    """
+    global _toeplitz_kernel
+    try:
+        import numba
+    except ImportError:
+        _toeplitz_kernel = _toeplitz_np
+        return _toeplitz_kernel
+
+    @numba.njit(boundscheck=False, cache=True)
+    def _toeplitz_jit(data_bytes, key_words, nbits):
+        """Return the Toeplitz hash value of a uint8 array (compiled)."""
+        h = np.uint32(0)
+        for i in range(nbits):
+            if (data_bytes[i >> 3] >> (7 - (i & 7))) & 1:
+                h ^= key_words[i]
+        return h
+
+    _toeplitz_kernel = _toeplitz_jit
+    return _toeplitz_kernel
+
+
+# cached Toeplitz key windows, indexed by (key, key length)
+_toeplitz_table_cache = {}
+
+
+def _get_toeplitz_table(key, keylen, needed_bits):
+    """Return the Toeplitz key windows for the first 'needed_bits' data bits.
+
+    Element j of the returned array is the 32 bit window of the key that is
+    XORed into the hash value if data bit j (counted from the MSB) is set.
+    Tables are computed once per key and extended if a longer input is hashed
+    later on.
+    """
+    table = _toeplitz_table_cache.get((key, keylen))
+    if table is None or len(table) < needed_bits:
+        # build table for the longest input (IPv6 + TCP/UDP ports) right away
+        # if the key is long enough
+        shift = keylen * 8 - 32
+        n_bits = max(needed_bits, min(288, shift + 1))
+        table = np.array([(key >> (shift - j)) & 0xFFFFFFFF
+                          for j in range(n_bits)], dtype=np.uint32)
+        _toeplitz_table_cache[(key, keylen)] = table
+    return table[:needed_bits]
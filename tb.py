@@ -29,28 +29,31 @@
 # Provides some basic test bench functions that are needed quite frequently.
 
 import cocotb
-from cocotb.triggers import Timer, RisingEdge
-from random import randint
-import numpy as np
+from cocotb.triggers import RisingEdge
+from cocotb.clock import Clock
+from cocotb.result import TestFailure
+from random import choices
+import struct
 import sys
 
 
-@cocotb.coroutine
 def clk_gen(sig_clk, freq_mhz):
-    """Generate a clock with a specifiable clock frequency in MHz."""
+    """Generate a clock with a specifiable clock frequency in MHz.
+
+    Returns the coroutine of a cocotb Clock driving the signal, which shall be
+    forked (e.g. cocotb.fork(clk_gen(dut.clk, 100))).
+    """
     t_clk = 1e6/freq_mhz
-    while True:
-        sig_clk <= 0
-        yield Timer(t_clk/2)
-        sig_clk <= 1
-        yield Timer(t_clk/2)
+    # clock period in simulator steps, the clock starts low
+    return Clock(sig_clk, t_clk).start(start_high=False)
 
 
 @cocotb.coroutine
 def wait_n_cycles(sig_clk, n_cycles):
     """Wait a specific number of rising clock events."""
+    edge = RisingEdge(sig_clk)
     for _ in range(n_cycles):
-        yield RisingEdge(sig_clk)
+        yield edge
 
 
 @cocotb.coroutine
@@ -60,11 +63,13 @@ def rst(sig_clk, sig_rst):
     Trigger the reset signal of the DuT for 5 clock cycles. Provided reset
     signal must be active high.
     """
-    yield RisingEdge(sig_clk)
+    edge = RisingEdge(sig_clk)
+    yield edge
     sig_rst <= 1
-    yield wait_n_cycles(sig_clk, 5)
+    for _ in range(5):
+        yield edge
     sig_rst <= 0
-    yield RisingEdge(sig_clk)
+    yield edge
 
 
 @cocotb.coroutine
@@ -74,22 +79,45 @@ def rstn(sig_clk, sig_rstn):
     Trigger the reset signal of the DuT for 5 clock cycles. Provided reset
     signal must be active low.
     """
-    yield RisingEdge(sig_clk)
+    edge = RisingEdge(sig_clk)
+    yield edge
     sig_rstn <= 0
-    yield wait_n_cycles(sig_clk, 5)
+    for _ in range(5):
+        yield edge
     sig_rstn <= 1
-    yield RisingEdge(sig_clk)
+    yield edge
 
 
 @cocotb.coroutine
 def toggle_signal(clk, sig):
     """Randomly toggle the value of a one bit signal."""
+    # random number of cycles between toggles. The cycles are counted in this
+    # coroutine on a single trigger instead of in wait_n_cycles() coroutines
+    delays = _rand_ints(1, 25)
+    edge = RisingEdge(clk)
+
+    for _ in range(next(delays)):
+        yield edge
+
+    # the signal is driven by this coroutine only. Read its value once and
+    # keep track of it afterwards instead of reading it back for every toggle
+    state = int(sig)
+    while True:
+        state ^= 1
+        sig <= state
+        for _ in range(next(delays)):
+            yield edge
+
+
+def _rand_ints(a, b, batch_size=1024):
+    """Yield uniformly distributed random integers N with a <= N <= b.
+
+    The numbers are drawn from the (seedable) module-level random number
+    generator in batches, which is cheaper than one randint() call per number.
+    """
+    population = range(a, b+1)
     while True:
-        yield wait_n_cycles(clk, randint(1, 25))
-        if int(sig) == 0:
-            sig <= 1
-        else:
-            sig <= 0
+        yield from choices(population, k=batch_size)
 
 
 def check_value(name, val1, val2):
@@ -98,14 +126,35 @@ def check_value(name, val1, val2):
         return
 
     msg = "Incorrect value '%s': 0x%x != 0x%x" % (name, val1, val2)
-    raise cocotb.result.TestFailure(msg)
+    raise TestFailure(msg)
+
+
+# big-endian pack and little-endian unpack functions for native integer sizes,
+# indexed by byte length
+_swp_struct = {bytelen: (struct.Struct('>' + fmt).pack,
+                         struct.Struct('<' + fmt).unpack)
+               for bytelen, fmt in ((2, 'H'), (4, 'I'), (8, 'Q'))}
 
 
 def swp_byte_order(data, bytelen):
     """Return the input data in reversed byte order."""
-    h = '%x' % data
-    s = ('0'*(len(h) % 2) + h).zfill(bytelen*2).decode('hex')
-    return int(s[::-1].encode('hex'), 16)
+    funcs = _swp_struct.get(bytelen)
+    if funcs is not None:
+        try:
+            return funcs[1](funcs[0](data))[0]
+        except struct.error:
+            pass  # value does not fit, use the general path below
+
+    # values wider than bytelen bytes are reversed over their full width
+    bytelen = max(bytelen, (data.bit_length() + 7) // 8)
+    return int.from_bytes(data.to_bytes(bytelen, 'big'), 'little')
+
+
+# state of print_progress(): number of iterations of the current run, the
+# next 10% step and the iteration on which it is reached
+_progress_n = None
+_progress_k = 1
+_progress_next = 0
 
 
 def print_progress(i, n):
@@ -114,17 +163,31 @@ def print_progress(i, n):
     Parameter 'i' defines the current iteration number (0 <= i < n). Parameter
     'n' defines the total number of iterations.
     """
-    # calculate iteration thresholds on which print out shall occur
-    thresholds = np.arange(n/10-1, n, n/10)
+    global _progress_n, _progress_k, _progress_next
 
+    if i == 0 or n != _progress_n:
+        # new run, first print out after the first 10% of the iterations
+        _progress_n = n
+        _progress_k = 1
+        _progress_next = (n + 9) // 10 - 1
+
+    # progress is printed on a single line, one write per print out
+    write = sys.stdout.write
     if i == 0:
         # this is the first iteration
-        print("Status: 0% ..."),
+        write("Status: 0% ... ")
         sys.stdout.flush()
-    if i in thresholds:
+    if i >= _progress_next:
         # print out progress
-        print("%d%% ..." % int(100.0*float(i+1)/float(n))),
+        write("%d%% ... " % (100*(i+1) // n))
         sys.stdout.flush()
+
+        # advance to the next 10% step that has not been reached yet
+        k = _progress_k + 1
+        while k <= 10 and (n*k + 9) // 10 - 1 <= i:
+            k += 1
+        _progress_k = k
+        _progress_next = (n*k + 9) // 10 - 1 if k <= 10 else n
     if i == n-1:
         # this is the last iteration
-        print("done!")
+        write("done!\n")